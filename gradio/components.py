@@ -45,7 +45,7 @@ from gradio.events import (
     Streamable,
     Submittable,
 )
-from gradio.utils import component_or_layout_class
+from gradio.utils import component_or_layout_class, strip_invalid_filename_characters
 
 set_documentation_group("component")
 
@@ -122,7 +122,7 @@ class IOComponent(Component):
         """
         Saved flagged file and returns filepath
         """
-        label = "".join([char for char in label if char.isalnum() or char in "._- "])
+        label = strip_invalid_filename_characters(label)
         old_file_name = file.name
         output_dir = os.path.join(dir, label)
         if os.path.exists(output_dir):
@@ -185,8 +185,10 @@ class Examples:
                     prediction = self.process_example(example_id)
                     cache_logger.flag(prediction)
                 except Exception as e:
+                    cache_logger.close()
                     shutil.rmtree(self.cached_folder)
                     raise e
+            cache_logger.close()
 
     def process_example(self, example_id: int) -> Tuple[List[Any], List[float]]:
         """Loads an example from the interface and returns its prediction.
@@ -1,12 +1,20 @@
 from __future__ import annotations
 
+import atexit
 import csv
 import datetime
 import io
-import json
 import os
+import queue
+import stat
+import tempfile
+import threading
+import warnings
 from abc import ABC, abstractmethod
-from typing import TYPE_CHECKING, Any, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import IO, TYPE_CHECKING, Any, List, Optional, Tuple
+
+import orjson
 
 import gradio as gr
 from gradio import encryptor, utils
@@ -17,6 +25,177 @@ if TYPE_CHECKING:
 
 set_documentation_group("flagging")
 
+# File previews for certain input and output types
+FILE_PREVIEW_TYPES = {
+    gr.inputs.Audio: "Audio",
+    gr.outputs.Audio: "Audio",
+    gr.inputs.Image: "Image",
+    gr.outputs.Image: "Image",
+}
+
+# Components whose save_flagged() writes a file, and so is worth running in parallel
+FILE_COMPONENT_TYPES = (
+    gr.components.Audio,
+    gr.components.File,
+    gr.components.Image,
+    gr.components.Model3D,
+    gr.components.Video,
+)
+
+# The umask can only be read by setting it, which is not thread-safe, so it is read
+# once at import time
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def _open_for_append(path: str) -> int:
+    """Opens (creating it if needed) the file at path for appending and returns its fd."""
+    flags = os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, "O_BINARY", 0)
+    return os.open(path, flags, 0o666)
+
+
+def _is_replaced(path: str, opened_stat: os.stat_result) -> bool:
+    """
+    Returns whether the file opened_stat was taken from is no longer at path, e.g.
+    because it was deleted or rotated away while it was kept open.
+    """
+    try:
+        return not os.path.samestat(os.stat(path), opened_stat)
+    except FileNotFoundError:
+        return True
+
+
+def _write_all(fd: int, data: bytes) -> None:
+    """Writes data to fd, issuing a single write() for small rows."""
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view) :]
+
+
+def _replace_file(path: str, data: bytes) -> None:
+    """
+    Atomically replaces the contents of the file at path with data, keeping the
+    permissions of the file, or the ones open() would give a new file.
+    """
+    try:
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        mode = 0o666 & ~_UMASK
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".")
+    try:
+        with os.fdopen(fd, "wb") as tmp_file:
+            tmp_file.write(data)
+        # mkstemp() always creates the file readable by its owner only
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def _make_save_pool(
+    components: List[Component], labels: List[str]
+) -> Optional[ThreadPoolExecutor]:
+    """
+    Returns a thread pool to save flagged samples on if more than one component saves
+    a file, or None if they should just be saved one after the other. Components
+    saving into the same folder would race on picking file names, so they are never
+    saved in parallel.
+    """
+    # Labels are compared as the folder names save_file() makes of them, lowercased
+    # for case-insensitive filesystems
+    file_labels = [
+        utils.strip_invalid_filename_characters(label or "").lower()
+        for component, label in zip(components, labels)
+        if isinstance(component, FILE_COMPONENT_TYPES)
+    ]
+    if len(file_labels) < 2 or len(set(file_labels)) < len(file_labels):
+        return None
+    return ThreadPoolExecutor(max_workers=min(8, len(file_labels)))
+
+
+def _save_flagged_samples(
+    pool: Optional[ThreadPoolExecutor], jobs: List[Tuple[Component, tuple]]
+) -> List[Any]:
+    """
+    Calls component.save_flagged(*args) for every (component, args) in jobs and
+    returns the results in order. If a pool is provided, the FILE_COMPONENT_TYPES
+    jobs run on it; any other component may still write files of its own (e.g. a
+    Carousel saves into sub-folders named after its label), so those are saved on
+    this thread before the pool jobs start.
+    """
+    if pool is None:
+        return [component.save_flagged(*args) for component, args in jobs]
+    results = [
+        None
+        if isinstance(component, FILE_COMPONENT_TYPES)
+        else component.save_flagged(*args)
+        for component, args in jobs
+    ]
+    futures = [
+        (idx, pool.submit(component.save_flagged, *args))
+        for idx, (component, args) in enumerate(jobs)
+        if isinstance(component, FILE_COMPONENT_TYPES)
+    ]
+    for idx, future in futures:
+        results[idx] = future.result()
+    return results
+
+
+def _fast_row(cells: List[Any]) -> Optional[str]:
+    """
+    Formats cells as one csv line quoted with "'" and csv.QUOTE_NONNUMERIC, without
+    going through csv.writer. Returns None if any cell needs escaping or is not a
+    plain str/int/float, in which case the caller should fall back to csv.writer.
+    """
+    fields = []
+    for cell in cells:
+        cell_type = type(cell)
+        if cell_type is str:
+            if "'" in cell:
+                return None
+            fields.append("'" + cell + "'")
+        elif cell_type is int or cell_type is float or cell_type is bool:
+            fields.append(str(cell))
+        else:
+            return None
+    return ",".join(fields) + "\r\n"
+
+
+def _format_csv_rows(rows: List[List[Any]]) -> str:
+    """Formats rows exactly as csv.writer(quoting=csv.QUOTE_NONNUMERIC, quotechar="'") would."""
+    lines = []
+    writer = None
+    for row in rows:
+        line = _fast_row(row)
+        if line is None:
+            # One fallback writer is shared by all the rows that need escaping
+            if writer is None:
+                output = io.StringIO()
+                writer = csv.writer(output, quoting=csv.QUOTE_NONNUMERIC, quotechar="'")
+            writer.writerow(row)
+            line = output.getvalue()
+            output.seek(0)
+            output.truncate()
+        lines.append(line)
+    return "".join(lines)
+
+
+def _count_csv_rows(csvfile: IO[bytes], quotechar: bytes = b'"') -> int:
+    """
+    Counts the rows in a csv file written by csv.writer without parsing its fields.
+    A physical line that leaves an odd number of quotechars open continues the row
+    on the next line, so quoted cells containing newlines are still counted once.
+    """
+    count = 0
+    in_quotes = False
+    for line in csvfile:
+        if line.count(quotechar) & 1:
+            in_quotes = not in_quotes
+        if not in_quotes:
+            count += 1
+    return count
+
 
 class FlaggingCallback(ABC):
     """
@@ -56,6 +235,13 @@ class FlaggingCallback(ABC):
         """
         pass
 
+    def close(self):
+        """
+        This method may be overridden to release any resources held by the FlaggingCallback
+        and to make sure that all flagged samples have been saved.
+        """
+        pass
+
 
 @document()
 class SimpleCSVLogger(FlaggingCallback):
@@ -71,13 +257,27 @@ class SimpleCSVLogger(FlaggingCallback):
                             flagging_callback=SimpleCSVLogger())
     """
 
+    # Class-level defaults, so subclasses that override __init__ still work
+    _fd = None  # log file opened for appending on the first flag
+    _pool = None
+
     def __init__(self):
         pass
 
     def setup(self, components: List[Component], flagging_dir: str):
+        self.close()
         self.components = components
         self.flagging_dir = flagging_dir
         os.makedirs(flagging_dir, exist_ok=True)
+        self._pool = _make_save_pool(
+            components, [component.label for component in components]
+        )
+        self._log_filepath = os.path.join(flagging_dir, "log.csv")
+        if os.path.exists(self._log_filepath):
+            with open(self._log_filepath, "rb") as csvfile:
+                self._row_count = _count_csv_rows(csvfile, quotechar=b"'")
+        else:
+            self._row_count = 0
 
     def flag(
         self,
@@ -87,26 +287,36 @@ class SimpleCSVLogger(FlaggingCallback):
         username: Optional[str] = None,
     ) -> int:
         flagging_dir = self.flagging_dir
-        log_filepath = os.path.join(flagging_dir, "log.csv")
 
-        csv_data = []
-        for component, sample in zip(self.components, flag_data):
-            csv_data.append(
-                component.save_flagged(
-                    flagging_dir,
-                    component.label,
-                    sample,
-                    None,
-                )
-            )
-
-        with open(log_filepath, "a", newline="") as csvfile:
-            writer = csv.writer(csvfile, quoting=csv.QUOTE_NONNUMERIC, quotechar="'")
-            writer.writerow(csv_data)
+        csv_data = _save_flagged_samples(
+            self._pool,
+            [
+                (component, (flagging_dir, component.label, sample, None))
+                for component, sample in zip(self.components, flag_data)
+            ],
+        )
 
-        with open(log_filepath, "r") as csvfile:
-            line_count = len([None for row in csv.reader(csvfile)]) - 1
-        return line_count
+        if self._fd is not None and _is_replaced(self._log_filepath, self._fd_stat):
+            # log.csv was deleted or moved away, so start a new one
+            os.close(self._fd)
+            self._fd = None
+        if self._fd is None:
+            self._fd = _open_for_append(self._log_filepath)
+            self._fd_stat = os.fstat(self._fd)
+            if self._fd_stat.st_size == 0:
+                self._row_count = 0
+        _write_all(self._fd, _format_csv_rows([csv_data]).encode("utf-8"))
+        self._row_count += 1
+
+        return self._row_count - 1  # zero-based index of the row just written
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
 
 
 @document()
@@ -122,6 +332,10 @@ class CSVLogger(FlaggingCallback):
                             flagging_callback=CSVLogger())
     """
 
+    # Class-level defaults, so subclasses that override __init__ still work
+    _fd = None  # log file opened for appending on the first flag
+    _pool = None
+
     def __init__(self):
         pass
 
@@ -131,10 +345,49 @@ class CSVLogger(FlaggingCallback):
         flagging_dir: str,
         encryption_key: Optional[str] = None,
     ):
+        self.close()
         self.components = components
         self.flagging_dir = flagging_dir
         self.encryption_key = encryption_key
         os.makedirs(flagging_dir, exist_ok=True)
+        self._pool = _make_save_pool(
+            components,
+            [
+                component.label or f"component {idx}"
+                for idx, component in enumerate(components)
+            ],
+        )
+        self._log_filepath = os.path.join(flagging_dir, "log.csv")
+        self._is_new = not os.path.exists(self._log_filepath)
+        # Decrypted log, kept in memory when encrypting so flag() never re-decrypts it
+        self._plaintext_buf = bytearray()
+        if self._is_new:
+            self._row_count = 0
+        elif encryption_key:
+            with open(self._log_filepath, "rb") as csvfile:
+                self._plaintext_buf += encryptor.decrypt(encryption_key, csvfile.read())
+            csvfile = io.BytesIO(self._plaintext_buf)
+            self._row_count = _count_csv_rows(csvfile, quotechar=b"'") - 1
+        else:
+            with open(self._log_filepath, "rb") as csvfile:
+                self._row_count = _count_csv_rows(csvfile, quotechar=b"'") - 1
+        self._flag_col_index = None
+        self._headers = [
+            component.label or f"component {idx}"
+            for idx, component in enumerate(components)
+        ] + [
+            "flag",
+            "username",
+            "timestamp",
+        ]
+        # The log is only ever encrypted or not for a given setup, so pick the
+        # matching writers once instead of checking on every flag
+        if encryption_key:
+            self._append_row = self._append_row_encrypted
+            self._edit_flag = self._edit_flag_encrypted
+        else:
+            self._append_row = self._append_row_plain
+            self._edit_flag = self._edit_flag_plain
 
     def flag(
         self,
@@ -143,88 +396,109 @@ class CSVLogger(FlaggingCallback):
         flag_index: Optional[int] = None,
         username: Optional[str] = None,
     ) -> int:
-        flagging_dir = self.flagging_dir
-        log_filepath = os.path.join(flagging_dir, "log.csv")
-        is_new = not os.path.exists(log_filepath)
-
-        if flag_index is None:
-            csv_data = []
-            for idx, (component, sample) in enumerate(zip(self.components, flag_data)):
-                csv_data.append(
-                    component.save_flagged(
-                        flagging_dir,
-                        component.label or f"component {idx}",
-                        sample,
-                        self.encryption_key,
-                    )
-                    if sample is not None
-                    else ""
-                )
-            csv_data.append(flag_option if flag_option is not None else "")
-            csv_data.append(username if username is not None else "")
-            csv_data.append(str(datetime.datetime.now()))
-            if is_new:
-                headers = [
-                    component.label or f"component {idx}"
-                    for idx, component in enumerate(self.components)
-                ] + [
-                    "flag",
-                    "username",
-                    "timestamp",
-                ]
-
-        def replace_flag_at_index(file_content):
-            file_content = io.StringIO(file_content)
-            content = list(csv.reader(file_content))
-            header = content[0]
-            flag_col_index = header.index("flag")
-            content[flag_index][flag_col_index] = flag_option
-            output = io.StringIO()
-            writer = csv.writer(output, quoting=csv.QUOTE_NONNUMERIC, quotechar="'")
-            writer.writerows(content)
-            return output.getvalue()
-
-        if self.encryption_key:
-            output = io.StringIO()
-            if not is_new:
-                with open(log_filepath, "rb", encoding="utf-8") as csvfile:
-                    encrypted_csv = csvfile.read()
-                    decrypted_csv = encryptor.decrypt(
-                        self.encryption_key, encrypted_csv
-                    )
-                    file_content = decrypted_csv.decode()
-                    if flag_index is not None:
-                        file_content = replace_flag_at_index(file_content)
-                    output.write(file_content)
-            writer = csv.writer(output, quoting=csv.QUOTE_NONNUMERIC, quotechar="'")
-            if flag_index is None:
-                if is_new:
-                    writer.writerow(headers)
-                writer.writerow(csv_data)
-            with open(log_filepath, "wb", encoding="utf-8") as csvfile:
-                csvfile.write(
-                    encryptor.encrypt(self.encryption_key, output.getvalue().encode())
-                )
-        else:
-            if flag_index is None:
-                with open(log_filepath, "a", newline="", encoding="utf-8") as csvfile:
-                    writer = csv.writer(
-                        csvfile, quoting=csv.QUOTE_NONNUMERIC, quotechar="'"
-                    )
-                    if is_new:
-                        writer.writerow(headers)
-                    writer.writerow(csv_data)
-            else:
-                with open(log_filepath, encoding="utf-8") as csvfile:
-                    file_content = csvfile.read()
-                    file_content = replace_flag_at_index(file_content)
-                with open(
-                    log_filepath, "w", newline="", encoding="utf-8"
-                ) as csvfile:  # newline parameter needed for Windows
-                    csvfile.write(file_content)
-        with open(log_filepath, "r", encoding="utf-8") as csvfile:
-            line_count = len([None for row in csv.reader(csvfile)]) - 1
-        return line_count
+        if flag_index is not None:
+            self._edit_flag(flag_index, flag_option)
+            return self._row_count
+
+        jobs = [
+            (
+                component,
+                (
+                    self.flagging_dir,
+                    component.label or f"component {idx}",
+                    sample,
+                    self.encryption_key,
+                ),
+            )
+            for idx, (component, sample) in enumerate(zip(self.components, flag_data))
+            if sample is not None
+        ]
+        saved = iter(_save_flagged_samples(self._pool, jobs))
+        csv_data = [
+            next(saved) if sample is not None else ""
+            for _, sample in zip(self.components, flag_data)
+        ]
+        csv_data.append(flag_option if flag_option is not None else "")
+        csv_data.append(username if username is not None else "")
+        csv_data.append(datetime.datetime.now().isoformat(" ", "microseconds"))
+
+        self._append_row(csv_data)
+        self._row_count += 1
+        self._is_new = False
+        return self._row_count
+
+    def _append_row_plain(self, csv_data: List[Any]):
+        if self._fd is not None and _is_replaced(self._log_filepath, self._fd_stat):
+            # log.csv was deleted or moved away, so start a new one
+            os.close(self._fd)
+            self._fd = None
+        if self._fd is None:
+            self._fd = _open_for_append(self._log_filepath)
+            self._fd_stat = os.fstat(self._fd)
+            if self._fd_stat.st_size == 0:
+                self._is_new = True
+                self._row_count = 0
+        rows = [self._headers, csv_data] if self._is_new else [csv_data]
+        _write_all(self._fd, _format_csv_rows(rows).encode("utf-8"))
+
+    def _append_row_encrypted(self, csv_data: List[Any]):
+        if not self._is_new and not os.path.exists(self._log_filepath):
+            # log.csv was deleted, so start a new one
+            self._plaintext_buf = bytearray()
+            self._is_new = True
+            self._row_count = 0
+        rows = [self._headers, csv_data] if self._is_new else [csv_data]
+        self._plaintext_buf += _format_csv_rows(rows).encode("utf-8")
+        _replace_file(
+            self._log_filepath,
+            encryptor.encrypt(self.encryption_key, bytes(self._plaintext_buf)),
+        )
+
+    def _edit_flag_plain(self, flag_index: int, flag_option: Optional[str]):
+        with open(self._log_filepath, "rb") as csvfile:
+            file_content = self._replace_flag_at_index(
+                csvfile.read(), flag_index, flag_option
+            )
+        with open(self._log_filepath, "wb") as csvfile:
+            csvfile.write(file_content)
+
+    def _edit_flag_encrypted(self, flag_index: int, flag_option: Optional[str]):
+        self._plaintext_buf = bytearray(
+            self._replace_flag_at_index(self._plaintext_buf, flag_index, flag_option)
+        )
+        _replace_file(
+            self._log_filepath,
+            encryptor.encrypt(self.encryption_key, bytes(self._plaintext_buf)),
+        )
+
+    def _replace_flag_at_index(
+        self, file_content: bytes, flag_index: int, flag_option: Optional[str]
+    ) -> bytes:
+        # Rows are terminated by b"\r\n", so unless a cell contains "\r\n" itself
+        # only the header and the edited row need to be decoded and parsed.
+        lines = file_content.split(b"\r\n")
+        if len(lines) != self._row_count + 2:
+            csvfile = io.TextIOWrapper(
+                io.BytesIO(file_content), encoding="utf-8", newline=""
+            )
+            content = list(csv.reader(csvfile, quotechar="'"))
+            content[flag_index][content[0].index("flag")] = flag_option
+            return _format_csv_rows(content).encode("utf-8")
+        if self._flag_col_index is None:
+            header = next(csv.reader([lines[0].decode("utf-8")], quotechar="'"))
+            self._flag_col_index = header.index("flag")
+        row = next(csv.reader([lines[flag_index].decode("utf-8")], quotechar="'"))
+        row[self._flag_col_index] = flag_option
+        lines[flag_index] = _format_csv_rows([row])[: -len("\r\n")].encode("utf-8")
+        return b"\r\n".join(lines)
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
 
 
 @document()
@@ -241,6 +515,13 @@ class HuggingFaceDatasetSaver(FlaggingCallback):
                             allow_flagging="manual", flagging_callback=hf_writer)
     """
 
+    push_interval = 5  # seconds to wait for more flags before pushing to the Hub
+
+    # Class-level defaults, so subclasses that override __init__ still work
+    _pool = None
+    _push_thread = None
+    _lock = None
+
     def __init__(
         self,
         hf_token: str,
@@ -273,6 +554,13 @@ class HuggingFaceDatasetSaver(FlaggingCallback):
                 "Package `huggingface_hub` not found is needed "
                 "for HuggingFaceDatasetSaver. Try 'pip install huggingface_hub'."
             )
+        # Push the rows flagged so far before switching to the new components
+        self.close()
+        if self._lock is None:
+            # Flagged rows not written to the dataset yet, kept across setup() calls
+            self._lock = threading.Lock()
+            self._pending = bytearray()
+            self._pending_rows = 0  # number of flagged samples in self._pending
         path_to_dataset_repo = huggingface_hub.create_repo(
             name=self.dataset_name,
             token=self.hf_token,
@@ -281,6 +569,7 @@ class HuggingFaceDatasetSaver(FlaggingCallback):
             exist_ok=True,
         )
         self.path_to_dataset_repo = path_to_dataset_repo  # e.g. "https://huggingface.co/datasets/abidlabs/test-audio-10"
+        self._preview_url_prefix = "{}/resolve/main/".format(path_to_dataset_repo)
         self.components = components
         self.flagging_dir = flagging_dir
         self.dataset_dir = os.path.join(flagging_dir, self.dataset_name)
@@ -294,6 +583,61 @@ class HuggingFaceDatasetSaver(FlaggingCallback):
         # Should filename be user-specified?
         self.log_file = os.path.join(self.dataset_dir, "data.csv")
         self.infos_file = os.path.join(self.dataset_dir, "dataset_infos.json")
+        self._infos_written = os.path.exists(self.infos_file)
+        if os.path.exists(self.log_file):
+            self._is_new = False
+            with open(self.log_file, "rb") as csvfile:
+                self._row_count = _count_csv_rows(csvfile) - 1
+        else:
+            self._is_new = True
+            self._row_count = 0
+        # Rows whose push failed are still pending, along with the header if the
+        # log did not exist yet
+        if self._pending:
+            self._is_new = False
+            self._row_count += self._pending_rows
+
+        # The headers and dataset_infos only depend on the components
+        self._labels = [component.label for component in components]
+        self._is_preview = []
+        self._headers = []
+        infos = {"flagged": {"features": {}}}
+        for component, label in zip(components, self._labels):
+            preview_type = None
+            for component_type, _type in FILE_PREVIEW_TYPES.items():
+                if isinstance(component, component_type):
+                    preview_type = _type
+                    break
+            self._is_preview.append(preview_type is not None)
+            self._headers.append(label)
+            infos["flagged"]["features"][label] = {
+                "dtype": "string",
+                "_type": "Value",
+            }
+            if preview_type is not None:
+                self._headers.append(label + " file")
+                infos["flagged"]["features"][label + " file"] = {"_type": preview_type}
+        self._headers.append("flag")
+        infos["flagged"]["features"]["flag"] = {
+            "dtype": "string",
+            "_type": "Value",
+        }
+        self._infos_bytes = orjson.dumps(infos, option=orjson.OPT_NON_STR_KEYS)
+
+        self._pool = _make_save_pool(components, self._labels)
+        # One csv writer is reused for every flagged row, guarded by self._lock
+        self._row_buffer = io.StringIO()
+        self._writer = csv.writer(self._row_buffer)
+
+        # Flagged rows are buffered in memory and written, committed and pushed by a
+        # background thread, so that bursts of flags go to the Hub as a single commit.
+        self._push_queue = queue.Queue()
+        self._closed = threading.Event()
+        self._push_thread = threading.Thread(target=self._periodic_push, daemon=True)
+        self._push_thread.start()
+        atexit.register(self.close)
+        if self._pending:
+            self._push_queue.put(True)
 
     def flag(
         self,
@@ -302,70 +646,101 @@ class HuggingFaceDatasetSaver(FlaggingCallback):
         flag_index: Optional[int] = None,
         username: Optional[str] = None,
     ) -> int:
-        self.repo.git_pull(lfs=True)
-
-        is_new = not os.path.exists(self.log_file)
-        infos = {"flagged": {"features": {}}}
-
-        with open(self.log_file, "a", newline="", encoding="utf-8") as csvfile:
-            writer = csv.writer(csvfile)
-
-            # File previews for certain input and output types
-            file_preview_types = {
-                gr.inputs.Audio: "Audio",
-                gr.outputs.Audio: "Audio",
-                gr.inputs.Image: "Image",
-                gr.outputs.Image: "Image",
-            }
-
-            # Generate the headers and dataset_infos
-            if is_new:
-                headers = []
-
-                for component, sample in zip(self.components, flag_data):
-                    headers.append(component.label)
-                    headers.append(component.label)
-                    infos["flagged"]["features"][component.label] = {
-                        "dtype": "string",
-                        "_type": "Value",
-                    }
-                    if isinstance(component, tuple(file_preview_types)):
-                        headers.append(component.label + " file")
-                        for _component, _type in file_preview_types.items():
-                            if isinstance(component, _component):
-                                infos["flagged"]["features"][
-                                    component.label + " file"
-                                ] = {"_type": _type}
-                                break
-
-                headers.append("flag")
-                infos["flagged"]["features"]["flag"] = {
-                    "dtype": "string",
-                    "_type": "Value",
-                }
-
-                writer.writerow(headers)
-
-            # Generate the row corresponding to the flagged sample
-            csv_data = []
-            for component, sample in zip(self.components, flag_data):
-                filepath = component.save_flagged(
-                    self.dataset_dir, component.label, sample, None
+        # Generate the row corresponding to the flagged sample
+        filepaths = _save_flagged_samples(
+            self._pool,
+            [
+                (component, (self.dataset_dir, label, sample, None))
+                for component, label, sample in zip(
+                    self.components, self._labels, flag_data
                 )
-                csv_data.append(filepath)
-                if isinstance(component, tuple(file_preview_types)):
-                    csv_data.append(
-                        "{}/resolve/main/{}".format(self.path_to_dataset_repo, filepath)
+            ],
+        )
+        csv_data = []
+        for filepath, is_preview in zip(filepaths, self._is_preview):
+            csv_data.append(filepath)
+            if is_preview:
+                csv_data.append(self._preview_url_prefix + filepath)
+        csv_data.append(flag_option if flag_option is not None else "")
+
+        with self._lock:
+            if self._is_new:
+                self._writer.writerow(self._headers)
+                self._is_new = False
+            self._writer.writerow(csv_data)
+            self._pending += self._row_buffer.getvalue().encode("utf-8")
+            self._row_buffer.seek(0)
+            self._row_buffer.truncate()
+            self._pending_rows += 1
+            self._row_count += 1
+            row_count = self._row_count
+        self._push_queue.put(True)
+
+        return row_count
+
+    def close(self):
+        """
+        Pushes any flagged samples that have not been pushed yet and stops the
+        background thread.
+        """
+        if self._push_thread is not None:
+            self._closed.set()
+            self._push_queue.put(None)
+            self._push_thread.join()
+            # A later setup() starts a new thread for the flags that follow
+            self._push_thread = None
+            atexit.unregister(self.close)
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def _periodic_push(self):
+        while True:
+            if self._push_queue.get() is None:
+                return
+            # Wait for more flags to arrive so that they can share a single push
+            self._closed.wait(self.push_interval)
+            closing = False
+            while True:
+                try:
+                    item = self._push_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    closing = True
+            try:
+                self._push_pending()
+            except Exception as e:
+                warnings.warn(
+                    "Could not push flagged samples to {}: {}".format(
+                        self.path_to_dataset_repo, e
                     )
-            csv_data.append(flag_option if flag_option is not None else "")
-            writer.writerow(csv_data)
-
-        if is_new:
-            json.dump(infos, open(self.infos_file, "w"))
-
-        with open(self.log_file, "r", encoding="utf-8") as csvfile:
-            line_count = len([None for row in csv.reader(csvfile)]) - 1
-
-        self.repo.push_to_hub(commit_message="Flagged sample #{}".format(line_count))
+                )
+            if closing:
+                return
 
-        return line_count
+    def _push_pending(self):
+        self.repo.git_pull(lfs=True)
+        # Rows flagged during the pull are taken too, so the commit message is built
+        # from the rows that are actually written
+        with self._lock:
+            pending, self._pending = self._pending, bytearray()
+            num_flags, self._pending_rows = self._pending_rows, 0
+            row_count = self._row_count
+        if not num_flags:
+            return
+        if num_flags == 1:
+            commit_message = "Flagged sample #{}".format(row_count)
+        else:
+            commit_message = "Flagged {} samples, up to #{}".format(
+                num_flags, row_count
+            )
+        fd = _open_for_append(self.log_file)
+        try:
+            _write_all(fd, pending)
+        finally:
+            os.close(fd)
+        if not self._infos_written:
+            _replace_file(self.infos_file, self._infos_bytes)
+            self._infos_written = True
+        self.repo.push_to_hub(commit_message=commit_message)
@@ -295,6 +295,11 @@ def resolve_singleton(_list):
         return _list
 
 
+def strip_invalid_filename_characters(filename: str) -> str:
+    """Removes every character that is not alphanumeric or one of "._- " from filename."""
+    return "".join([char for char in filename if char.isalnum() or char in "._- "])
+
+
 def component_or_layout_class(cls_name: str) -> Component | BlockContext:
     """
     Returns the component, template, or layout class with the given class name, or
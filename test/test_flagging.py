@@ -1,12 +1,30 @@
+import csv
+import io
+import json
 import os
 import tempfile
 import unittest
-from unittest.mock import MagicMock
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from unittest.mock import MagicMock, patch
 
 import huggingface_hub
 
 import gradio as gr
-from gradio import flagging
+from gradio import encryptor, flagging, media_data
+
+
+@contextmanager
+def record_save_pools():
+    """Yields a list of the thread pools that flagging callbacks create to save on."""
+    pools = []
+
+    def make_pool(*args, **kwargs):
+        pools.append(ThreadPoolExecutor(*args, **kwargs))
+        return pools[-1]
+
+    with patch.object(flagging, "ThreadPoolExecutor", side_effect=make_pool):
+        yield pools
 
 
 class TestDefaultFlagging(unittest.TestCase):
@@ -20,6 +38,160 @@ class TestDefaultFlagging(unittest.TestCase):
             self.assertEqual(row_count, 2)  # 3 rows written including header
         io.close()
 
+    def test_subclass_overriding_init(self):
+        class TaggedCSVLogger(flagging.CSVLogger):
+            def __init__(self, tag):
+                self.tag = tag
+
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            io = gr.Interface(
+                lambda x: x,
+                "text",
+                "text",
+                flagging_dir=tmpdirname,
+                flagging_callback=TaggedCSVLogger("tag"),
+            )
+            io.launch(prevent_thread_lock=True)
+            row_count = io.flagging_callback.flag(["test", "test"])
+            self.assertEqual(row_count, 1)
+            io.flagging_callback.close()
+        io.close()
+
+    def test_row_count_resumes_from_existing_log(self):
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            components = [gr.Textbox(label="input"), gr.Textbox(label="output")]
+            callback = flagging.CSVLogger()
+            callback.setup(components, tmpdirname)
+            callback.flag(["test", "test"])
+            callback.flag(["multi\nline", "test"])
+            callback = flagging.CSVLogger()
+            callback.setup(components, tmpdirname)
+            row_count = callback.flag(["test", "test"])
+            self.assertEqual(row_count, 3)
+
+    def test_new_log_started_after_log_removed(self):
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            components = [gr.Textbox(label="input"), gr.Textbox(label="output")]
+            log_filepath = os.path.join(tmpdirname, "log.csv")
+            callback = flagging.CSVLogger()
+            callback.setup(components, tmpdirname)
+            callback.flag(["first", "test"])
+            os.remove(log_filepath)
+            self.assertEqual(callback.flag(["second", "test"]), 1)
+            os.rename(log_filepath, log_filepath + ".1")
+            self.assertEqual(callback.flag(["third", "test"]), 1)
+            callback.close()
+            with open(log_filepath, newline="") as csvfile:
+                rows = list(csv.reader(csvfile, quotechar="'"))
+            self.assertEqual([row[0] for row in rows], ["input", "third"])
+
+    def test_files_saved_in_parallel(self):
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            components = [
+                gr.Image(label="first"),
+                gr.Textbox(label="text"),
+                gr.Image(label="second"),
+            ]
+            callback = flagging.CSVLogger()
+            with record_save_pools() as pools:
+                callback.setup(components, tmpdirname)
+            self.assertEqual(len(pools), 1)
+            image = media_data.BASE64_IMAGE
+            callback.flag([image, "test", image])
+            callback.close()
+            with open(os.path.join(tmpdirname, "log.csv"), newline="") as csvfile:
+                rows = list(csv.reader(csvfile, quotechar="'"))
+            self.assertEqual(rows[1][:3], ["first/0.png", "test", "second/0.png"])
+            self.assertTrue(os.path.exists(os.path.join(tmpdirname, "first/0.png")))
+            self.assertTrue(os.path.exists(os.path.join(tmpdirname, "second/0.png")))
+
+    def test_files_sharing_a_folder_saved_serially(self):
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            components = [gr.Image(label="photo?"), gr.Image(label="photo!")]
+            callback = flagging.CSVLogger()
+            with record_save_pools() as pools:
+                callback.setup(components, tmpdirname)
+            self.assertEqual(pools, [])
+            image = media_data.BASE64_IMAGE
+            callback.flag([image, image])
+            callback.close()
+            with open(os.path.join(tmpdirname, "log.csv"), newline="") as csvfile:
+                rows = list(csv.reader(csvfile, quotechar="'"))
+            self.assertEqual(rows[1][:2], ["photo/0.png", "photo/1.png"])
+            self.assertEqual(len(os.listdir(os.path.join(tmpdirname, "photo"))), 2)
+
+    def test_carousel_saved_apart_from_file_components(self):
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            components = [
+                gr.Carousel(components=gr.Image(), label="x"),
+                gr.Image(label="x_0"),
+                gr.Image(label="y"),
+            ]
+            callback = flagging.CSVLogger()
+            callback.setup(components, tmpdirname)
+            image = media_data.BASE64_IMAGE
+            callback.flag([[[image]], image, image])
+            callback.close()
+            with open(os.path.join(tmpdirname, "log.csv"), newline="") as csvfile:
+                rows = list(csv.reader(csvfile, quotechar="'"))
+            self.assertEqual(json.loads(rows[1][0]), [["x_0/0.png"]])
+            self.assertEqual(rows[1][1:3], ["x_0/1.png", "y/0.png"])
+            self.assertEqual(len(os.listdir(os.path.join(tmpdirname, "x_0"))), 2)
+
+    def test_flag_option_edit(self):
+        for sample in ["single line", "multi\r\nline"]:
+            with tempfile.TemporaryDirectory() as tmpdirname:
+                components = [gr.Textbox(label="input"), gr.Textbox(label="output")]
+                callback = flagging.CSVLogger()
+                callback.setup(components, tmpdirname)
+                callback.flag([sample, "test"])
+                callback.flag([sample, "test"])
+                row_count = callback.flag([], flag_option="bad", flag_index=1)
+                self.assertEqual(row_count, 2)
+                with open(os.path.join(tmpdirname, "log.csv"), newline="") as csvfile:
+                    rows = list(csv.reader(csvfile, quotechar="'"))
+                self.assertEqual(len(rows), 3)
+                self.assertEqual([row[0] for row in rows[1:]], [sample, sample])
+                self.assertEqual([row[2] for row in rows[1:]], ["bad", ""])
+
+    def test_encrypted_flagging_callback(self):
+        key = encryptor.get_key("password")
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            components = [gr.Textbox(label="input"), gr.Textbox(label="output")]
+            callback = flagging.CSVLogger()
+            callback.setup(components, tmpdirname, encryption_key=key)
+            self.assertEqual(callback.flag(["first", "test"]), 1)
+            callback = flagging.CSVLogger()
+            callback.setup(components, tmpdirname, encryption_key=key)
+            self.assertEqual(callback.flag(["second", "test"]), 2)
+            self.assertEqual(callback.flag([], flag_option="bad", flag_index=1), 2)
+            with open(os.path.join(tmpdirname, "log.csv"), "rb") as csvfile:
+                content = encryptor.decrypt(key, csvfile.read()).decode()
+            rows = list(csv.reader(io.StringIO(content), quotechar="'"))
+            self.assertEqual(rows[0][:2], ["input", "output"])
+            self.assertEqual([row[0] for row in rows[1:]], ["first", "second"])
+            self.assertEqual([row[2] for row in rows[1:]], ["bad", ""])
+
+    @unittest.skipIf(os.name == "nt", "file modes are not supported on Windows")
+    def test_encrypted_log_keeps_file_mode(self):
+        key = encryptor.get_key("password")
+        components = [gr.Textbox(label="input"), gr.Textbox(label="output")]
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            plain_dir = os.path.join(tmpdirname, "plain")
+            callback = flagging.CSVLogger()
+            callback.setup(components, plain_dir)
+            callback.flag(["test", "test"])
+            callback.close()
+            plain_mode = os.stat(os.path.join(plain_dir, "log.csv")).st_mode
+
+            log_filepath = os.path.join(tmpdirname, "log.csv")
+            callback.setup(components, tmpdirname, encryption_key=key)
+            callback.flag(["test", "test"])
+            self.assertEqual(os.stat(log_filepath).st_mode, plain_mode)
+            os.chmod(log_filepath, 0o640)
+            callback.flag(["test", "test"])
+            self.assertEqual(os.stat(log_filepath).st_mode & 0o777, 0o640)
+
 
 class TestSimpleFlagging(unittest.TestCase):
     def test_simple_csv_flagging_callback(self):
@@ -39,15 +211,61 @@ class TestSimpleFlagging(unittest.TestCase):
         io.close()
 
 
+class TestCSVRowFormatting(unittest.TestCase):
+    def test_format_csv_rows_matches_csv_writer(self):
+        rows = [
+            ["input", "output", "flag", "username", "timestamp"],
+            ["plain", "", 1, 2.5, True],
+            ["it's", "multi\nline", "a,b", None, {"label": "cat"}],
+        ]
+        output = io.StringIO()
+        writer = csv.writer(output, quoting=csv.QUOTE_NONNUMERIC, quotechar="'")
+        writer.writerows(rows)
+        self.assertEqual(flagging._format_csv_rows(rows), output.getvalue())
+        self.assertIsNone(flagging._fast_row(rows[2]))
+
+    def test_count_csv_rows_matches_csv_reader(self):
+        rows = [
+            ["input", "output"],
+            ["it's", "multi\r\nline"],
+            ["''", "a\n'b'\nc"],
+            ["plain", 1],
+        ]
+        output = io.StringIO()
+        writer = csv.writer(output, quoting=csv.QUOTE_NONNUMERIC, quotechar="'")
+        writer.writerows(rows)
+        csvfile = io.BytesIO(output.getvalue().encode("utf-8"))
+        self.assertEqual(flagging._count_csv_rows(csvfile, quotechar=b"'"), len(rows))
+
+
 class TestHuggingFaceDatasetSaver(unittest.TestCase):
     def test_saver_setup(self):
         huggingface_hub.create_repo = MagicMock()
         huggingface_hub.Repository = MagicMock()
         flagger = flagging.HuggingFaceDatasetSaver("test", "test")
         with tempfile.TemporaryDirectory() as tmpdirname:
-            flagger.setup([gr.Audio, gr.Textbox], tmpdirname)
+            flagger.setup([gr.Audio(), gr.Textbox()], tmpdirname)
         huggingface_hub.create_repo.assert_called_once()
 
+    def test_saver_subclass_overriding_init(self):
+        class TestDatasetSaver(flagging.HuggingFaceDatasetSaver):
+            def __init__(self):
+                self.hf_token = "test"
+                self.dataset_name = "test"
+                self.dataset_private = False
+
+        huggingface_hub.create_repo = MagicMock()
+        huggingface_hub.Repository = MagicMock()
+        flagger = TestDatasetSaver()
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            os.mkdir(os.path.join(tmpdirname, "test"))
+            flagger.setup([gr.Textbox(label="a")], tmpdirname)
+            self.assertEqual(flagger.flag(["1"]), 1)
+            flagger.close()
+            with open(os.path.join(tmpdirname, "test", "data.csv")) as csvfile:
+                rows = list(csv.reader(csvfile))
+            self.assertEqual(rows, [["a", "flag"], ["1", ""]])
+
     def test_saver_flag(self):
         huggingface_hub.create_repo = MagicMock()
         huggingface_hub.Repository = MagicMock()
@@ -65,6 +283,75 @@ class TestHuggingFaceDatasetSaver(unittest.TestCase):
             self.assertEqual(row_count, 1)  # 2 rows written including header
             row_count = io.flagging_callback.flag(["test", "test"])
             self.assertEqual(row_count, 2)  # 3 rows written including header
+            io.flagging_callback.close()
+            # Both flags were pushed to the Hub together
+            io.flagging_callback.repo.push_to_hub.assert_called_once()
+            with open(os.path.join(tmpdirname, "test", "data.csv")) as csvfile:
+                rows = list(csv.reader(csvfile))
+            self.assertEqual(rows[0], ["x", "output", "flag"])
+            self.assertEqual(rows[1], ["test", "test", ""])
+            with open(os.path.join(tmpdirname, "test", "dataset_infos.json")) as f:
+                self.assertIn("flagged", json.load(f))
+
+    def test_saver_flag_after_close(self):
+        huggingface_hub.create_repo = MagicMock()
+        huggingface_hub.Repository = MagicMock()
+        flagger = flagging.HuggingFaceDatasetSaver("test", "test")
+        components = [gr.Textbox(label="a")]
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            os.mkdir(os.path.join(tmpdirname, "test"))
+            flagger.setup(components, tmpdirname)
+            flagger.flag(["1"])
+            flagger.close()
+            flagger.setup(components, tmpdirname)
+            self.assertEqual(flagger.flag(["2"]), 2)
+            flagger.close()
+            self.assertEqual(flagger.repo.push_to_hub.call_count, 2)
+            with open(os.path.join(tmpdirname, "test", "data.csv")) as csvfile:
+                rows = list(csv.reader(csvfile))
+            self.assertEqual(rows, [["a", "flag"], ["1", ""], ["2", ""]])
+
+    def test_saver_commit_message_covers_flags_during_pull(self):
+        huggingface_hub.create_repo = MagicMock()
+        huggingface_hub.Repository = MagicMock()
+        flagger = flagging.HuggingFaceDatasetSaver("test", "test")
+        flagger.push_interval = 0
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            os.mkdir(os.path.join(tmpdirname, "test"))
+            flagger.setup([gr.Textbox(label="a")], tmpdirname)
+
+            def flag_during_pull(lfs=False):
+                if flagger.repo.git_pull.call_count == 2:
+                    flagger.flag(["2"])
+                    flagger.flag(["3"])
+
+            flagger.repo.git_pull.side_effect = flag_during_pull
+            flagger.flag(["1"])
+            flagger.close()
+            flagger.repo.push_to_hub.assert_called_once_with(
+                commit_message="Flagged 3 samples, up to #3"
+            )
+
+    def test_saver_setup_again_before_push(self):
+        huggingface_hub.create_repo = MagicMock()
+        huggingface_hub.Repository = MagicMock()
+        flagger = flagging.HuggingFaceDatasetSaver("test", "test")
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            os.mkdir(os.path.join(tmpdirname, "test"))
+            with record_save_pools() as pools:
+                flagger.setup([gr.Image(label="a"), gr.Image(label="b")], tmpdirname)
+            self.assertEqual(len(pools), 1)
+            components = [gr.Textbox(label="a")]
+            flagger.setup(components, tmpdirname)
+            with self.assertRaises(RuntimeError):
+                pools[0].submit(print)
+            flagger.flag(["1"])
+            flagger.setup(components, tmpdirname)
+            self.assertEqual(flagger.flag(["2"]), 2)
+            flagger.close()
+            with open(os.path.join(tmpdirname, "test", "data.csv")) as csvfile:
+                rows = list(csv.reader(csvfile))
+            self.assertEqual(rows, [["a", "flag"], ["1", ""], ["2", ""]])
 
 
 class TestDisableFlagging(unittest.TestCase):